@@ -9,25 +9,187 @@ streams.
 :copyright: (c) 2025 by Tim Prince
 :license: GPL v3, see COPYING for details.
 """
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, fields
-from typing import Annotated, Callable
-from xml.etree.ElementTree import Element, ElementTree, indent
+from datetime import datetime, timezone
+from functools import lru_cache
+import re
+from typing import IO, Annotated, Callable, Iterable, cast
+from lxml.etree import (Element,
+                        ElementTree,
+                        _Element,
+                        _ElementTree,
+                        SubElement,
+                        XPath,
+                        indent,
+                        iterparse,
+                        tostring,
+                        xmlfile)
 from rss_slicer import rss
 
 Callback = Annotated[
-    Callable[[Element], bool],
+    Callable[[_Element], bool],
     """\
 Bundles together an XPath query and a function
 that modifies an XML element. The function should
 modify the passed-in Element in-place and return
 `True` if the element (and its children) should be
 deleted from the tree and `False` if it should be
-preserved.
+preserved. Callbacks passed to `slice_feeds` with more
+than one worker may run on several threads at once.
 """
 ]
 
 
-def apply_one_mutation(tree: Element, query: str, mutator: Callback):
+_Namespaces = tuple[tuple[str, str], ...]
+
+
+def _freeze(namespaces: dict[str, str] | None) -> _Namespaces:
+    return tuple(sorted(namespaces.items())) if namespaces else ()
+
+
+# A tag name, optionally qualified in Clark notation as `{uri}name`.
+_NAME = r'(?:\{[^}]*\})?[A-Za-z_][\w.-]*'
+
+_CHILD_QUERY = re.compile(rf'(?:\./)?({_NAME})')
+
+_CLARK_STEP = re.compile(r'(?:^|/)\{')
+
+
+_Query = Callable[[_Element], list[_Element]]
+
+
+def _xpath(query: str, namespaces: dict[str, str] | None = None) -> _Query:
+    # lxml types XPath results as any XPath value; the queries compiled
+    # here always select elements.
+    return cast(_Query, XPath(query, namespaces=namespaces))
+
+
+@lru_cache(maxsize=256)
+def _compile(query: str, namespaces: _Namespaces = ()) -> _Query:
+    """Compile an XPath query, reusing the result for repeated queries.
+
+    Prefixed names such as `dc:creator` are resolved against
+    `namespaces`. Queries that select children by tag name are answered
+    with a plain child iteration, which avoids the XPath engine
+    altogether. Queries that spell out namespaces in Clark notation
+    (`./channel/item/{uri}creator`) are ElementPath rather than XPath and
+    are evaluated with `findall`.
+    """
+    match = _CHILD_QUERY.fullmatch(query)
+    if match is not None:
+        tag = match[1]
+        return lambda tree: list(tree.iterchildren(tag))
+
+    prefixes = dict(namespaces)
+    if _CLARK_STEP.search(query):
+        return lambda tree: tree.findall(query, prefixes)
+
+    return _xpath(query, prefixes)
+
+
+_SIMPLE_PATH = re.compile(
+    rf'(?:(?:\.|\*|{_NAME})/{{1,2}})*({_NAME})'
+)
+
+
+@lru_cache(maxsize=256)
+def _target_tag(query: str) -> str | None:
+    """Return the tag that a plain downward path such as `./channel/item`
+    selects, or `None` if the query is anything more elaborate."""
+    match = _SIMPLE_PATH.fullmatch(query)
+    return match[1] if match is not None else None
+
+
+def delete(_: _Element) -> bool:
+    """A mutator that deletes every element selected by its query.
+
+    Pairing it with a query filtered by :func:`where` keeps the whole
+    selection inside the XPath engine; `apply_one_mutation` recognises
+    this mutator and removes the matches without calling back into
+    Python for each of them.
+    """
+    return True
+
+
+def _literal(text: str) -> str:
+    if "'" not in text:
+        return f"'{text}'"
+
+    if '"' not in text:
+        return f'"{text}"'
+
+    parts = text.split("'")
+    return 'concat(' + ", \"'\", ".join(f"'{p}'" for p in parts) + ')'
+
+
+def where(query: str, predicate: str) -> str:
+    """Restrict `query` to the nodes that satisfy the XPath `predicate`.
+
+    For example, `where('./channel/item', contains_text('title', 'NASA'))`
+    selects only the items whose title mentions NASA.
+    """
+    return f'{query}[{predicate}]'
+
+
+def contains_text(path: str, text: str) -> str:
+    """Build an XPath predicate that holds when the string value of
+    `path` contains `text`. `text` is quoted as an XPath literal."""
+    return f'contains({path}, {_literal(text)})'
+
+
+def xpath_text(path: str,
+               namespaces: dict[str, str] | None = None
+               ) -> Callable[[_Element], str | None]:
+    """Make a function that returns the text of the first element that
+    `path` selects relative to its argument, or `None` if there is none.
+    Prefixes in `path` are resolved against `namespaces`.
+
+    The query is compiled once, so mutators should build these up front,
+    e.g. `title = xpath_text('title')`, rather than calling `find` on every
+    element they are given.
+    """
+    query = _compile(path, _freeze(namespaces))
+
+    def text(e: _Element) -> str | None:
+        found = query(e)
+        return found[0].text if found else None
+
+    return text
+
+
+_PUB_DATE = XPath('string(pubDate)')
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def published_before(cutoff: datetime) -> Callback:
+    """Make a mutator that deletes items published before `cutoff`.
+
+    Naive datetimes, on either side of the comparison, are taken to be in
+    UTC. Items with a missing or unparseable `pubDate` are kept. To drop
+    everything older than a week, pair it with `./channel/item` and a
+    cutoff of `datetime.now(timezone.utc) - timedelta(days=7)`.
+    """
+    limit = _as_utc(cutoff)
+
+    def cb(e: _Element) -> bool:
+        text = str(_PUB_DATE(e))
+        if not text:
+            return False
+
+        try:
+            return _as_utc(rss.parse_date(text)) < limit
+        except ValueError:
+            return False
+
+    return cb
+
+
+def apply_one_mutation(tree: _Element, query: str, mutator: Callback,
+                       namespaces: dict[str, str] | None = None):
     """Given a mutation, apply it to the children of `tree` that
     satisfy the associated XPath query. The tree is modified in-place.
 
@@ -36,31 +198,54 @@ def apply_one_mutation(tree: Element, query: str, mutator: Callback):
     :param query: the XPath query to select elements which should be
         mutated.
     :param mutator: the mutation function to apply to the tree.
+    :param namespaces: maps the namespace prefixes used in `query` to
+        their URIs.
     :rtype: None
     """
-    nodes = tree.findall(query)
-    to_remove = []
-    for node in nodes:
-        if mutator(node):
-            to_remove.append(node)
+    _apply_one(tree, query, mutator, _freeze(namespaces))
+
+
+def _apply_one(tree: _Element, query: str, mutator: Callback,
+               namespaces: _Namespaces):
+    # Skip queries whose target tag is absent. lxml only answers iter(tag)
+    # without walking the tree when the name is missing from its name
+    # dictionary, which is shared by every document parsed on the same
+    # parser and thread. Once any earlier feed used the tag, an absent tag
+    # costs a full walk of the tree; that is still cheaper than running
+    # the query, but not free.
+    tag = _target_tag(query)
+    if tag is not None and next(tree.iter(tag), None) is None:
+        return
 
-    for node in to_remove:
-        parent = tree.find(f'{query}/..')
-        assert parent is not None
-        parent.remove(node)
+    unconditional = mutator is delete
 
+    # The compiled query returns a snapshot list, so matches can be
+    # removed while walking it.
+    for node in _compile(query, namespaces)(tree):
+        if unconditional or mutator(node):
+            parent = node.getparent()
+            if parent is not None:
+                parent.remove(node)
 
-def apply_mutations(tree: Element, mutations: list[tuple[str, Callback]]):
+
+def apply_mutations(tree: _Element, mutations: list[tuple[str, Callback]],
+                    namespaces: dict[str, str] | None = None):
     """Given a list of mutations, apply them in sequence to
     the given tree.
 
     :param tree: the root XML node to which the transformations should be
         applied.
     :param mutations: the mutations to apply to the tree.
+    :param namespaces: maps the namespace prefixes used in the queries to
+        their URIs.
     :rtype: None
     """
-    for mutation in mutations:
-        apply_one_mutation(tree, *mutation)
+    frozen = _freeze(namespaces)
+    for query, mutator in mutations:
+        _apply_one(tree, query, mutator, frozen)
+
+
+_CHANNEL_FIELDS = tuple(field.name for field in fields(rss.Channel))
 
 
 def merge_meta_trivial(
@@ -76,11 +261,9 @@ def merge_meta_trivial(
         left.description
     )
 
-    for field in fields(rss.Channel):
-        new_value = (getattr(left, field.name)
-                     or getattr(right, field.name))
-
-        setattr(result, field.name, new_value)
+    for name in _CHANNEL_FIELDS:
+        new_value = getattr(left, name) or getattr(right, name)
+        setattr(result, name, new_value)
 
     return result
 
@@ -91,42 +274,239 @@ def preserve_meta(_: rss.Channel,
     return right
 
 
-@dataclass
+@dataclass(slots=True)
 class SliceDefinition:
-    """Defines how to produce a sliced feed from a set of input feeds."""
+    """Defines how to produce a sliced feed from a set of input feeds.
+    `namespaces` maps the prefixes used in the slicer queries, such as
+    `dc` in `./channel/item/dc:creator`, to namespace URIs."""
     meta: rss.Channel
     slicers: list[tuple[str, Callback]]
     keep_unrecognized: bool = False
     meta_strategy: Callable[[rss.Channel,
                              rss.Channel], rss.Channel] = merge_meta_trivial
+    namespaces: dict[str, str] | None = None
 
 
-def slice_feeds(
-        input_feeds: list[ElementTree],
-        output_feed: SliceDefinition) -> ElementTree:
-    """Slice a set of RSS feeds according to the specified output feeds."""
+_CHANNEL = _xpath('./channel')
+_ITEMS = _xpath('./channel/item')
+
+
+def _parse_channel(feed: _Element) -> rss.Channel:
+    channels = _CHANNEL(feed)
+    if not channels:
+        raise ValueError('No channel element found in RSS feed.')
+    return rss.Channel.parse(channels[0])
 
-    roots = [root for root in (tree.getroot() for tree in input_feeds)
-             if root is not None]
 
-    for feed in roots:
-        apply_mutations(feed, output_feed.slicers)
+def _render_feed(meta: rss.Channel,
+                 nsmap: dict[str | None, str],
+                 items: list[_Element]) -> _ElementTree:
+    # lxml-stubs do not admit the None key of a default namespace.
+    document = Element('rss', attrib={'version': '2.0'},
+                       nsmap=cast(dict[str, str], nsmap))
+    meta.render(document).extend(items)
+    indent(document)
+    return ElementTree(document)
 
+
+def _merge_meta(feeds: Iterable[_Element], output_feed: SliceDefinition
+                ) -> tuple[rss.Channel, dict[str | None, str]]:
     result = output_feed.meta
-    for feed in roots:
-        channel = feed.find('./channel')
-        if channel is None:
+    nsmap = {}
+    for feed in feeds:
+        result = output_feed.meta_strategy(result, _parse_channel(feed))
+        # Carry the input namespace declarations over so that extension
+        # elements in the items keep their original prefixes.
+        nsmap.update(feed.nsmap)
+
+    return result, nsmap
+
+
+def _merge_feeds(feeds: Iterable[_Element | None],
+                 output_feed: SliceDefinition) -> _ElementTree:
+    roots = [feed for feed in feeds if feed is not None]
+    items = [item for feed in roots for item in _ITEMS(feed)]
+    return _render_feed(*_merge_meta(roots, output_feed), items)
+
+
+def slice_feeds(
+        input_feeds: list[_ElementTree],
+        output_feed: SliceDefinition,
+        max_workers: int = 1) -> _ElementTree:
+    """Slice a set of RSS feeds according to the specified output feeds.
+
+    The input feeds are independent of each other, so when `max_workers`
+    is greater than one the slicers are applied to several feeds at once
+    on a thread pool. The slicer callbacks must be thread-safe in that
+    case. Metadata and items are always merged in input order.
+
+    The resulting tree is indented, so it can be written out as is.
+
+    :param input_feeds: the parsed RSS documents to slice.
+    :param output_feed: the definition of the feed to produce.
+    :param max_workers: the maximum number of feeds to slice concurrently.
+    :rtype: ElementTree
+    """
+    def mutate(tree: _ElementTree) -> _Element | None:
+        feed = tree.getroot()
+        if feed is not None:
+            apply_mutations(feed, output_feed.slicers,
+                            output_feed.namespaces)
+        return feed
+
+    workers = min(max_workers, len(input_feeds))
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            return _merge_feeds(executor.map(mutate, input_feeds),
+                                output_feed)
+
+    return _merge_feeds(map(mutate, input_feeds), output_feed)
+
+
+def _stream_items(source: str | IO[bytes],
+                  slicers: list[tuple[str, Callback]],
+                  namespaces: dict[str, str] | None,
+                  emit: Callable[[_Element], object]) -> _Element:
+    """Slice the items of `source` one at a time as the parser reads them,
+    passing each one that is kept to `emit`, and return the root of what
+    remains of the document.
+
+    Each `item` is detached from its document as soon as it has been read
+    and sliced on its own; see :func:`slice_sources` for which queries
+    that affects.
+    """
+    context = iterparse(source, events=('end',), tag='item')
+    scratch = channel = None
+    for _, item in context:
+        if scratch is None or channel is None:
+            parent = item.getparent()
+            root = parent.getparent() if parent is not None else None
+            if parent is None or root is None:
+                raise ValueError('No channel element found in RSS feed.')
+
+            scratch = Element(root.tag)
+            channel = SubElement(scratch, parent.tag)
+
+        channel.append(item)
+        apply_mutations(scratch, slicers, namespaces)
+        if channel.getparent() is None:
             raise ValueError('No channel element found in RSS feed.')
-        result = output_feed.meta_strategy(result, rss.Channel.parse(channel))
 
-    document = Element('rss', attrib={'version': '2.0'})
-    channel = result.render()
-    document.append(channel)
-    items = []
+        # Only items are collected, as _ITEMS does for whole documents.
+        for kept in channel.iterchildren('item'):
+            emit(kept)
+        del channel[:]
 
-    for feed in input_feeds:
-        items.extend(feed.findall('./channel/item'))
+    return context.root
 
-    channel.extend(items)
-    indent(document)
-    return ElementTree(document)
+
+def _stream_feed(source: str | IO[bytes],
+                 output_feed: SliceDefinition,
+                 emit: Callable[[_Element], object] | None = None
+                 ) -> _Element:
+    """Stream `source`, passing its sliced items to `emit`, and return
+    the root of its sliced metadata. When `emit` is None the items are
+    dropped unsliced.
+    """
+    if emit is None:
+        feed = _stream_items(source, [], None, lambda _: None)
+    else:
+        feed = _stream_items(source, output_feed.slicers,
+                             output_feed.namespaces, emit)
+
+    apply_mutations(feed, output_feed.slicers, output_feed.namespaces)
+    return feed
+
+
+def slice_sources(
+        sources: Iterable[str | IO[bytes]],
+        output_feed: SliceDefinition) -> _ElementTree:
+    """Slice a set of RSS documents read incrementally from `sources`.
+
+    This avoids holding every input document in memory at once. The items
+    are sliced as they are read and the remaining channel metadata is
+    sliced once the source is exhausted.
+
+    Each item is sliced on its own, in an otherwise empty `rss/channel`
+    skeleton. The result therefore only matches :func:`slice_feeds` for
+    slicers whose queries select an item by the item itself and its
+    descendants, such as `./channel/item`, `./channel/item/guid` or
+    `./channel/item[contains(title, 'NASA')]`. Queries that depend on
+    the position of an item or on the rest of the document, such as
+    `./channel/item[position() > 2]` or `./channel/item[../title='t']`,
+    only ever see the one item and select differently.
+
+    :raises ValueError: if a source has no `channel` element, or the
+        slicers delete it.
+
+    :param sources: file names or binary file objects to read RSS from.
+    :param output_feed: the definition of the feed to produce.
+    :rtype: ElementTree
+    """
+    items: list[_Element] = []
+    feeds = (_stream_feed(source, output_feed, items.append)
+             for source in sources)
+    meta, nsmap = _merge_meta(feeds, output_feed)
+    return _render_feed(meta, nsmap, items)
+
+
+def slice_feeds_streaming(
+        paths: list[str],
+        output_feed: SliceDefinition,
+        out: str | IO[bytes]):
+    """Slice a set of RSS files and write the result to `out` as it is
+    produced.
+
+    Unlike :func:`slice_sources`, the sliced items are never collected
+    in memory either: each one is written out with lxml's incremental
+    `xmlfile` writer as soon as the slicers have kept it. Because the
+    merged channel metadata has to be written before the first item,
+    every file is read twice, first for its metadata (which is sliced
+    before the items) and then for its items. Hence `paths` must name
+    files rather than one-shot streams. The output is not indented.
+
+    Items are sliced one at a time, with the same limits on the slicer
+    queries as :func:`slice_sources`.
+
+    :param paths: the names of the RSS files to slice.
+    :param output_feed: the definition of the feed to produce.
+    :param out: a file name or binary file object to write the feed to.
+    :raises ValueError: if a file has no `channel` element, or the
+        slicers delete it. Every file is checked before anything is
+        written to `out`.
+    :rtype: None
+    """
+    meta, nsmap = _merge_meta(
+        (_stream_feed(path, output_feed) for path in paths), output_feed)
+
+    channel = meta.render()
+    with xmlfile(out, encoding='utf-8') as xf:
+        xf.write_declaration()
+        with xf.element('rss', {'version': '2.0'}, nsmap=nsmap):
+            with xf.element(channel.tag):
+                for child in channel:
+                    xf.write(child)
+
+                for path in paths:
+                    _stream_items(path, output_feed.slicers,
+                                  output_feed.namespaces, xf.write)
+
+
+def serialize(feed: _ElementTree, pretty_print: bool = True) -> bytes:
+    """Serialise a sliced feed to UTF-8 encoded bytes, XML declaration
+    included, using lxml's C serialiser. The feed is not modified.
+
+    Feeds from :func:`slice_feeds` and :func:`slice_sources` are already
+    indented. `pretty_print` lays out trees that carry no whitespace of
+    their own; libxml2 leaves elements that already contain whitespace
+    text as they are.
+
+    :param feed: the feed to write, typically one produced by
+        :func:`slice_feeds` or :func:`slice_sources`.
+    :param pretty_print: whether to indent the output.
+    :rtype: bytes
+    """
+    return tostring(feed,
+                    xml_declaration=True,
+                    encoding='utf-8',
+                    pretty_print=pretty_print)
@@ -1,71 +1,194 @@
 """Utilities for parsing and rendering RSS documents and their sub-elements."""
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from email.utils import parsedate_to_datetime, format_datetime
-from typing import (Any,
+from functools import lru_cache
+import re
+from typing import (IO,
+                    Any,
                     Callable,
+                    Iterator,
                     Optional)
-from xml.etree.ElementTree import Element, SubElement
+from lxml.etree import Element, SubElement, _Element, iterparse
 
 
-def _get_text_or_none(e: Element | None) -> str | None:
-    return e.text if e is not None else None
+def _parse_list(e: _Element, name: str,
+                parser: Callable[[_Element], Any]) -> list[Any]:
+    return [parser(r) for r in e.iterchildren(name)]
 
 
-def _get_text_or_empty(e: Element | None) -> str:
-    text = _get_text_or_none(e)
-    return text or ''
+_Children = dict[str, list[_Element]]
 
 
-def _get(e: Element, name: str, ctor: Callable[[str], Any] = str):
-    return ctor(_get_text_or_empty(e.find(f'./{name}')))
+def _index_children(e: _Element, tags: tuple[str, ...]) -> _Children:
+    """Group the children of `e` with one of the given `tags` by tag in a
+    single pass so that parsers for elements with many fields need not
+    search the children once per field. Children with other tags (such
+    as the items of a channel) are skipped by lxml without ever reaching
+    Python."""
+    children: _Children = {}
+    for child in e.iterchildren(*tags):
+        children.setdefault(child.tag, []).append(child)
 
+    return children
 
-def _get_opt(e: Element, name: str, ctor: Callable[[str], Any] = str):
-    text = _get_text_or_none(e.find(f'./{name}'))
-    return ctor(text) if text is not None else None
 
+def _lookup(children: _Children, name: str,
+            ctor: Callable[[str], Any] = str):
+    found = children.get(name)
+    return ctor((found[0].text if found else None) or '')
 
-def _parse_opt(e: Element, name: str, parser: Callable[[Element], Any]):
-    result = e.find(f'./{name}')
 
-    if result is not None:
-        return parser(result)
+def _lookup_opt(children: _Children, name: str,
+                ctor: Callable[[str], Any] = str):
+    found = children.get(name)
+    text = found[0].text if found else None
+    return ctor(text) if text else None
 
-    return None
 
+def _lookup_parse_opt(children: _Children, name: str,
+                      parser: Callable[[_Element], Any]):
+    found = children.get(name)
+    return parser(found[0]) if found else None
 
-def _parse_list_opt(e: Element,
-                    name: str,
-                    parser: Callable[[Element], Any]) -> list[Any] | None:
-    result = e.findall(f'./{name}')
 
-    if len(result) == 0:
+def _lookup_parse_list_opt(children: _Children, name: str,
+                           parser: Callable[[_Element], Any]
+                           ) -> list[Any] | None:
+    found = children.get(name)
+    return [parser(f) for f in found] if found else None
+
+
+_WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+_MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+@lru_cache(maxsize=128)
+def _format_date_at(dt: datetime, offset: timedelta | None) -> str:
+    """Format `dt` exactly as `format_datetime` would, from name tables
+    rather than through a `timetuple()` and `strftime('%z')`."""
+    if offset is None:
+        zone = '-0000'
+    elif offset.microseconds or offset.seconds % 60:
+        return format_datetime(dt)
+    else:
+        minutes = int(offset.total_seconds()) // 60
+        sign = '-' if minutes < 0 else '+'
+        zone = f'{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}'
+
+    return (f'{_WEEKDAY_NAMES[dt.weekday()]}, {dt.day:02d} '
+            f'{_MONTH_NAMES[dt.month - 1]} {dt.year:04d} '
+            f'{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} {zone}')
+
+
+def _format_date(dt: datetime) -> str:
+    # Aware datetimes for the same instant compare equal even though they
+    # render with different offsets, so the offset is part of the key.
+    return _format_date_at(dt, dt.utcoffset())
+
+
+_RFC822_DATE = re.compile(
+    r'(?:[A-Z][a-z]{2}, )?(\d{1,2}) ([A-Z][a-z]{2}) (\d{4}) '
+    r'(\d{2}):(\d{2})(?::(\d{2}))? (?:([+-]\d{4})|([A-Z]{1,3}))'
+)
+
+_MONTHS = {name: number for number, name in enumerate(_MONTH_NAMES, start=1)}
+
+# The named zones understood by email.utils.
+_ZONES = {name: timezone(timedelta(hours=hours)) for name, hours in (
+    ('UT', 0), ('UTC', 0), ('GMT', 0), ('Z', 0),
+    ('AST', -4), ('ADT', -3), ('EST', -5), ('EDT', -4), ('CST', -6),
+    ('CDT', -5), ('MST', -7), ('MDT', -6), ('PST', -8), ('PDT', -7))}
+
+
+@lru_cache(maxsize=64)
+def _offset_zone(offset: str) -> timezone | None:
+    # RFC 2822 uses -0000 for "local time unknown".
+    if offset == '-0000':
         return None
 
-    return [parser(r) for r in result]
+    delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:]))
+    return timezone(-delta if offset[0] == '-' else delta)
+
+
+def _parse_rfc822(text: str) -> datetime:
+    """Parse the common, well-formed shape of an RFC 822 date with a single
+    regular expression, deferring to `parsedate_to_datetime` (with
+    identical results) for anything else."""
+    match = _RFC822_DATE.fullmatch(text)
+    if match is None:
+        return parsedate_to_datetime(text)
+
+    day, month, year, hour, minute, second, offset, zone = match.groups()
+
+    # email.utils maps years below 100 into 1950-2049, even when they are
+    # written with four digits.
+    if (month not in _MONTHS or (zone is not None and zone not in _ZONES)
+            or int(year) < 100):
+        return parsedate_to_datetime(text)
 
+    tzinfo = _ZONES[zone] if zone is not None else _offset_zone(offset)
+    return datetime(int(year), _MONTHS[month], int(day),
+                    int(hour), int(minute), int(second or 0),
+                    tzinfo=tzinfo)
 
-def _parse_list(e: Element, name: str,
-                parser: Callable[[Element], Any]) -> list[Any]:
-    return _parse_list_opt(e, name, parser) or []
 
+@lru_cache(maxsize=1024)
+def parse_date(text: str) -> datetime:
+    """Parse an RFC 822 date as used by RSS `pubDate` elements.
 
-def _read_int(e: Element) -> int:
+    Feeds are typically sliced again and again with mostly unchanged
+    contents, so parsed dates are memoised by their text.
+    """
+    return _parse_rfc822(text)
+
+
+def iter_items(source: str | IO[bytes]) -> Iterator[_Element]:
+    """Incrementally parse the RSS document in `source` and yield each of
+    its `item` elements as soon as it has been read.
+
+    Every item is detached from the document before it is yielded, so
+    the parser never holds more than the channel metadata and the item
+    being read. Memory use is bounded by the largest item rather than by
+    the size of the feed.
+
+    :param source: a file name or binary file object to read RSS from.
+    :raises ValueError: if an `item` is the root of the document.
+    :rtype: Iterator[Element]
+    """
+    for _, item in iterparse(source, events=('end',), tag='item'):
+        parent = item.getparent()
+        if parent is None:
+            raise ValueError('No channel element found in RSS feed.')
+
+        parent.remove(item)
+        yield item
+
+
+def _new_element(tag: str, parent: Optional[_Element]) -> _Element:
+    # Creating the element in place under its parent is cheaper in lxml than
+    # building a detached element and appending it afterwards.
+    return Element(tag) if parent is None else SubElement(parent, tag)
+
+
+def _read_int(e: _Element) -> int:
     if e.text is None:
         raise ValueError('No text for numeric element.')
     return int(e.text)
 
 
-@dataclass
+@dataclass(slots=True)
 class Category:
     """Stores a feed category as defined by the RSS specification."""
     text: str
     domain: Optional[str] = None
 
-    def render(self) -> Element:
-        """Render this item into an XML element."""
-        result = Element("category")
+    def render(self, parent: Optional[_Element] = None) -> _Element:
+        """Render this item into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('category', parent)
         result.text = self.text
         if self.domain is not None:
             result.attrib['domain'] = self.domain
@@ -73,7 +196,7 @@ class Category:
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'Category':
+    def parse(e: _Element) -> 'Category':
         """Parse the given 'category' element from an RSS document."""
         return Category(
             e.text or '',
@@ -81,7 +204,10 @@ class Category:
         )
 
 
-@dataclass
+_IMAGE_TAGS = ('url', 'title', 'link', 'width', 'height', 'description')
+
+
+@dataclass(slots=True)
 class Image:
     """Stores a feed image as defined by the RSS specification."""
     url: str
@@ -91,9 +217,10 @@ class Image:
     height: Optional[int] = None
     description: Optional[str] = None
 
-    def render(self) -> Element:
-        """Render this image into an XML element."""
-        result = Element('image')
+    def render(self, parent: Optional[_Element] = None) -> _Element:
+        """Render this image into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('image', parent)
 
         url = SubElement(result, 'url')
         url.text = self.url
@@ -119,19 +246,20 @@ class Image:
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'Image':
+    def parse(e: _Element) -> 'Image':
         """Parse the given 'image' element from an RSS document."""
+        children = _index_children(e, _IMAGE_TAGS)
         return Image(
-            _get(e, 'url'),
-            _get(e, 'title'),
-            _get(e, 'link'),
-            _get_opt(e, 'width', int),
-            _get_opt(e, 'height', int),
-            _get_opt(e, 'description')
+            _lookup(children, 'url'),
+            _lookup(children, 'title'),
+            _lookup(children, 'link'),
+            _lookup_opt(children, 'width', int),
+            _lookup_opt(children, 'height', int),
+            _lookup_opt(children, 'description')
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Cloud:
     """
     Stores a cloud field as defined by the RSS specification.
@@ -142,9 +270,10 @@ class Cloud:
     register_procedure: str
     protocol: str
 
-    def render(self) -> Element:
-        """Render this item into an XML element."""
-        result = Element('cloud')
+    def render(self, parent: Optional[_Element] = None) -> _Element:
+        """Render this item into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('cloud', parent)
         result.attrib['domain'] = self.domain
         result.attrib['port'] = str(self.port)
         result.attrib['path'] = self.path
@@ -153,18 +282,21 @@ class Cloud:
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'Cloud':
+    def parse(e: _Element) -> 'Cloud':
         """Parse the given 'cloud' element from an RSS document."""
         return Cloud(
-            e.attrib['domain'],
+            str(e.attrib['domain']),
             int(e.attrib['port']),
-            e.attrib['path'],
-            e.attrib['registerProcedure'],
-            e.attrib['protocol']
+            str(e.attrib['path']),
+            str(e.attrib['registerProcedure']),
+            str(e.attrib['protocol'])
         )
 
 
-@dataclass
+_TEXT_INPUT_TAGS = ('title', 'description', 'name', 'link')
+
+
+@dataclass(slots=True)
 class TextInput:
     """
     Stores a textInput field as defined by the RSS specification.
@@ -174,9 +306,10 @@ class TextInput:
     name: str
     link: str
 
-    def render(self) -> Element:
-        """Render this item into an XML element."""
-        result = Element('textInput')
+    def render(self, parent: Optional[_Element] = None) -> _Element:
+        """Render this item into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('textInput', parent)
 
         title = SubElement(result, 'title')
         title.text = self.title
@@ -193,17 +326,18 @@ class TextInput:
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'TextInput':
+    def parse(e: _Element) -> 'TextInput':
         """Parse the given 'textInput' element from an RSS document."""
+        children = _index_children(e, _TEXT_INPUT_TAGS)
         return TextInput(
-            _get(e, 'title'),
-            _get(e, 'description'),
-            _get(e, 'name'),
-            _get(e, 'link')
+            _lookup(children, 'title'),
+            _lookup(children, 'description'),
+            _lookup(children, 'name'),
+            _lookup(children, 'link')
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class SkipHours:
     """
     Stores the contents of a skipHours element as defined by
@@ -211,9 +345,10 @@ class SkipHours:
     """
     hours: list[int]
 
-    def render(self) -> Element:
-        """Render this item into an XML element."""
-        result = Element('skipHours')
+    def render(self, parent: Optional[_Element] = None) -> _Element:
+        """Render this item into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('skipHours', parent)
 
         for h in self.hours:
             e = SubElement(result, 'hour')
@@ -222,14 +357,14 @@ class SkipHours:
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'SkipHours':
+    def parse(e: _Element) -> 'SkipHours':
         """Parse the given 'skipHours' element from an RSS document."""
         return SkipHours(
             _parse_list(e, 'hour', _read_int)
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class SkipDays:
     """
     Stores the contents of a skipDays element as defined by
@@ -237,9 +372,10 @@ class SkipDays:
     """
     days: list[str]
 
-    def render(self) -> Element:
-        """Render this item into an XML element."""
-        result = Element('skipDays')
+    def render(self, parent: Optional[_Element] = None) -> _Element:
+        """Render this item into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('skipDays', parent)
 
         for d in self.days:
             e = SubElement(result, 'day')
@@ -248,14 +384,22 @@ class SkipDays:
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'SkipDays':
+    def parse(e: _Element) -> 'SkipDays':
         """Parse the given 'skipDays' element from an RSS document."""
         return SkipDays(
             _parse_list(e, 'day', lambda d: d.text)
         )
 
 
-@dataclass
+_CHANNEL_TAGS = (
+    'title', 'link', 'description', 'language', 'copyright',
+    'managingEditor', 'webMaster', 'pubDate', 'lastBuildDate', 'category',
+    'generator', 'docs', 'cloud', 'ttl', 'image', 'rating', 'textInput',
+    'skipHours', 'skipDays'
+)
+
+
+@dataclass(slots=True)
 class Channel:
     """
     Stores required and optional metadata about an RSS feed as defined
@@ -281,9 +425,11 @@ class Channel:
     skip_hours: Optional[SkipHours] = None
     skip_days: Optional[SkipDays] = None
 
-    def render(self) -> Element:
-        """Render this item into an XML element."""
-        result = Element('channel')
+    def render(  # pylint: disable=too-many-locals
+            self, parent: Optional[_Element] = None) -> _Element:
+        """Render this item into an XML element, created as the last child
+        of `parent` when one is given."""
+        result = _new_element('channel', parent)
 
         title = SubElement(result, 'title')
         title.text = self.title
@@ -312,14 +458,15 @@ class Channel:
 
         if self.pub_date is not None:
             pub_date = SubElement(result, 'pubDate')
-            pub_date.text = format_datetime(self.pub_date)
+            pub_date.text = _format_date(self.pub_date)
 
         if self.last_build_date is not None:
             last_build_date = SubElement(result, 'lastBuildDate')
-            last_build_date.text = format_datetime(self.last_build_date)
+            last_build_date.text = _format_date(self.last_build_date)
 
         if self.categories is not None:
-            result.extend(c.render() for c in self.categories)
+            for category in self.categories:
+                category.render(result)
 
         if self.generator is not None:
             generator = SubElement(result, 'generator')
@@ -330,54 +477,55 @@ class Channel:
             docs.text = self.docs
 
         if self.cloud is not None:
-            result.append(self.cloud.render())
+            self.cloud.render(result)
 
         if self.ttl is not None:
             ttl = SubElement(result, 'ttl')
             ttl.text = str(self.ttl)
 
         if self.image is not None:
-            result.append(self.image.render())
+            self.image.render(result)
 
         if self.rating is not None:
             rating = SubElement(result, 'rating')
             rating.text = self.rating
 
         if self.text_input is not None:
-            result.append(self.text_input.render())
+            self.text_input.render(result)
 
         if self.skip_hours is not None:
-            result.append(self.skip_hours.render())
+            self.skip_hours.render(result)
 
         if self.skip_days is not None:
-            result.append(self.skip_days.render())
+            self.skip_days.render(result)
 
         return result
 
     @staticmethod
-    def parse(e: Element) -> 'Channel':
+    def parse(e: _Element) -> 'Channel':
         """
         Parse all RSS-specified metadata
         from the given 'channel' element.
         """
+        children = _index_children(e, _CHANNEL_TAGS)
         return Channel(
-            _get(e, 'title'),
-            _get(e, 'link'),
-            _get(e, 'description'),
-            _get_opt(e, 'language'),
-            _get_opt(e, 'copyright'),
-            _get_opt(e, 'managingEditor'),
-            _get_opt(e, 'webMaster'),
-            _get_opt(e, 'pubDate', parsedate_to_datetime),
-            _get_opt(e, 'lastBuildDate', parsedate_to_datetime),
-            _parse_list_opt(e, 'category', Category.parse),
-            _get_opt(e, 'generator'),
-            _get_opt(e, 'docs'),
-            _parse_opt(e, 'cloud', Cloud.parse),
-            _get_opt(e, 'ttl', int),
-            _parse_opt(e, 'image', Image.parse),
-            _get_opt(e, 'rating'),
-            _parse_opt(e, 'textInput', TextInput.parse),
-            _parse_opt(e, 'skipHours', SkipHours.parse),
-            _parse_opt(e, 'skipDays', SkipDays.parse)
+            _lookup(children, 'title'),
+            _lookup(children, 'link'),
+            _lookup(children, 'description'),
+            _lookup_opt(children, 'language'),
+            _lookup_opt(children, 'copyright'),
+            _lookup_opt(children, 'managingEditor'),
+            _lookup_opt(children, 'webMaster'),
+            _lookup_opt(children, 'pubDate', parse_date),
+            _lookup_opt(children, 'lastBuildDate', parse_date),
+            _lookup_parse_list_opt(children, 'category', Category.parse),
+            _lookup_opt(children, 'generator'),
+            _lookup_opt(children, 'docs'),
+            _lookup_parse_opt(children, 'cloud', Cloud.parse),
+            _lookup_opt(children, 'ttl', int),
+            _lookup_parse_opt(children, 'image', Image.parse),
+            _lookup_opt(children, 'rating'),
+            _lookup_parse_opt(children, 'textInput', TextInput.parse),
+            _lookup_parse_opt(children, 'skipHours', SkipHours.parse),
+            _lookup_parse_opt(children, 'skipDays', SkipDays.parse)
         )
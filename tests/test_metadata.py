@@ -1,6 +1,9 @@
 """Tests for rss slicer metadata types."""
-from datetime import datetime
-import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from io import BytesIO
+import lxml.etree as ET
+import pytest
 from pytest import raises
 from rss_slicer.rss import (Category,
                             Image,
@@ -9,6 +12,9 @@ from rss_slicer.rss import (Category,
                             SkipHours,
                             SkipDays,
                             Channel,
+                            iter_items,
+                            _format_date,
+                            _parse_rfc822,
                             _read_int)
 
 
@@ -38,6 +44,23 @@ def test_feedimage_roundtrip():
     assert image_opt == Image.parse(image_opt.render())
 
 
+def test_feedimage_parse_empty():
+    assert (Image('', 'title', '')
+            == Image.parse(ET.fromstring(
+                '<image><url/><title>title</title><width/></image>'
+            )))
+
+
+def test_render_into_parent():
+    parent = ET.Element('channel')
+    ET.SubElement(parent, 'title')
+    image = Image('im', 'ti', 'li').render(parent)
+
+    assert image.getparent() is parent
+    assert [child.tag for child in parent] == ['title', 'image']
+    assert Image('im', 'ti', 'li') == Image.parse(image)
+
+
 def test_feedcloud_roundtrip():
     cloud = Cloud("domain", 80, "/", "doStuff", "xml-rpc")
     assert cloud == Cloud.parse(cloud.render())
@@ -51,6 +74,7 @@ def test_textinput_roundtrip():
 def test_skiphours_roundtrip():
     skip_hours = SkipHours([1, 2, 3])
     assert skip_hours == SkipHours.parse(skip_hours.render())
+    assert SkipHours([]) == SkipHours.parse(SkipHours([]).render())
 
 
 def test_skipdays_roundtrip():
@@ -91,6 +115,75 @@ def test_metadata_roundtrip():
     assert meta_opt == Channel.parse(meta_opt.render())
 
 
+def test_render_date_offsets():
+    utc = datetime(2023, 7, 21, 13, 4, tzinfo=timezone.utc)
+    edt = utc.astimezone(timezone(timedelta(hours=-4)))
+    rendered = [Channel('t', 'l', 'd', pub_date=d).render().findtext('pubDate')
+                for d in (utc, edt, utc)]
+
+    assert rendered == ['Fri, 21 Jul 2023 13:04:00 +0000',
+                        'Fri, 21 Jul 2023 09:04:00 -0400',
+                        'Fri, 21 Jul 2023 13:04:00 +0000']
+
+
+@pytest.mark.parametrize('dt', [
+    datetime(1999, 3, 15, 12),
+    datetime(5, 1, 2, 3, 4, 5, 6),
+    datetime(2024, 2, 29, 23, 59, 59, tzinfo=timezone.utc),
+    datetime(2023, 7, 21, tzinfo=timezone(timedelta(hours=5, minutes=30))),
+    datetime(2023, 7, 21, tzinfo=timezone(timedelta(minutes=-30))),
+    datetime(2023, 7, 21, tzinfo=timezone(timedelta(hours=-11))),
+    datetime(2023, 7, 21, tzinfo=timezone(timedelta(seconds=-5))),
+])
+def test_format_date(dt: datetime):
+    assert _format_date(dt) == format_datetime(dt)
+
+
 def test_parse_int():
     with raises(ValueError):
         _read_int(ET.fromstring('<a/>'))
+
+
+def test_iter_items():
+    items = list(iter_items('./tests/samples/trivial.xml'))
+
+    assert all(item.getparent() is None for item in items)
+    assert ([item.findtext('guid') for item in items]
+            == [item.findtext('guid') for item
+                in ET.parse('./tests/samples/trivial.xml').iter('item')])
+
+    with raises(ValueError):
+        _ = list(iter_items(BytesIO(b'<item/>')))
+
+
+@pytest.mark.parametrize('text', [
+    'Tue, 10 Jun 2003 04:00:00 GMT',
+    'Fri, 21 Jul 2023 09:04 EDT',
+    '21 Jul 2023 09:04:59 +0530',
+    'Mon, 26 Jun 2023 12:45:00 -0930',
+    'Mon, 26 Jun 2023 12:45:00 +0000',
+    'Mon, 26 Jun 2023 12:45:00 -0000',
+    'Mon, 26 Jun 2023 12:45:00 XYZ',
+    'Mon, 26 jun 2023 12:45:00 GMT',
+    'Mon, 26 Jun 23 12:45:00 GMT',
+    'Monday, 26-Jun-2023 12:45:00 GMT',
+    'Mon, 26 Jun 0099 12:45:00 GMT',
+    'Sat, 26 Jun 0049 12:45:00 +0100',
+])
+def test_parse_rfc822(text: str):
+    expected = parsedate_to_datetime(text)
+    parsed = _parse_rfc822(text)
+
+    assert parsed == expected
+    assert parsed.utcoffset() == expected.utcoffset()
+
+
+def test_parse_rfc822_invalid():
+    with raises(ValueError):
+        _parse_rfc822('Mon, 31 Jun 2023 12:45:00 GMT')
+
+    with raises(ValueError):
+        _parse_rfc822('Mon, 26 Foo 2023 12:45:00 GMT')
+
+    with raises(ValueError):
+        _parse_rfc822('yesterday')
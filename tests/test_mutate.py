@@ -1,7 +1,15 @@
 """Tests for RSS slicing functionality."""
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import Element
-from rss_slicer import apply_one_mutation, apply_mutations, Callback
+from datetime import datetime, timezone
+import lxml.etree as ET
+from lxml.etree import _Element
+from rss_slicer import (apply_one_mutation,
+                        apply_mutations,
+                        contains_text,
+                        delete,
+                        published_before,
+                        where,
+                        xpath_text,
+                        Callback)
 
 
 class TestMutators:
@@ -10,7 +18,7 @@ class TestMutators:
     @staticmethod
     def retag(new_tag: str) -> Callback:
         """Make a mutator that replaces all tags with `new_tag`."""
-        def cb(e: Element) -> bool:
+        def cb(e: _Element) -> bool:
             e.tag = new_tag
             return False
 
@@ -21,7 +29,7 @@ class TestMutators:
         """Make a mutator that runs only once."""
         flag = False
 
-        def cb(e: Element) -> bool:
+        def cb(e: _Element) -> bool:
             nonlocal flag
             if not flag:
                 mutator(e)
@@ -34,7 +42,7 @@ class TestMutators:
     @staticmethod
     def delete() -> Callback:
         """Create a mutator that unconditionally deletes the element."""
-        def cb(_: Element) -> bool:
+        def cb(_: _Element) -> bool:
             return True
 
         return cb
@@ -42,7 +50,7 @@ class TestMutators:
     @staticmethod
     def delete_matching(tag: str) -> Callback:
         """Create a mutator that deletes any element with a matching tag."""
-        def cb(e: Element) -> bool:
+        def cb(e: _Element) -> bool:
             return e.tag == tag
 
         return cb
@@ -53,17 +61,120 @@ def test_trivial():
     root = ET.fromstring(b'<data><a/><b/><c/></data>')
 
     apply_one_mutation(
-        root, './',
+        root, './*',
         TestMutators.oneshot(TestMutators.retag('d'))
     )
-    assert b'<data><d /><b /><c /></data>' == ET.tostring(root)
+    assert b'<data><d/><b/><c/></data>' == ET.tostring(root)
 
     apply_mutations(
         root,
         [
             ('./b', TestMutators.retag('e')),
-            ('./', TestMutators.delete_matching('b')),
+            ('./*', TestMutators.delete_matching('b')),
             ('./d', TestMutators.delete())
         ]
     )
-    assert b'<data><e /><c /></data>' == ET.tostring(root)
+    assert b'<data><e/><c/></data>' == ET.tostring(root)
+
+
+def test_delete_across_parents():
+    root = ET.fromstring(b'<data><x><b/><c/></x><y><b/></y><b/></data>')
+
+    apply_one_mutation(root, './/b', TestMutators.delete())
+    assert b'<data><x><c/></x><y/></data>' == ET.tostring(root)
+
+
+def test_delete_root():
+    root = ET.fromstring(b'<data><a/></data>')
+
+    apply_one_mutation(root, '.', TestMutators.delete())
+    assert b'<data><a/></data>' == ET.tostring(root)
+
+
+def test_child_queries():
+    root = ET.fromstring(
+        b'<data xmlns:x="urn:x"><a><b/></a><x:b/><b/><b/></data>'
+    )
+
+    apply_one_mutation(root, 'b', TestMutators.retag('c'))
+    apply_one_mutation(root, './c', TestMutators.delete())
+    assert (b'<data xmlns:x="urn:x"><a><b/></a><x:b/></data>'
+            == ET.tostring(root))
+
+
+def test_predicate_delete():
+    root = ET.fromstring(
+        b'<data><a>keep</a><a>drop\'"me</a><a>drop\'me</a>'
+        b'<a>drop"me</a></data>'
+    )
+
+    apply_one_mutation(root, where('./a', contains_text('.', 'drop\'"')),
+                       delete)
+    apply_one_mutation(root, where('./a', contains_text('.', "drop'")),
+                       delete)
+    apply_one_mutation(root, where('./a', contains_text('text()', 'drop')),
+                       delete)
+    assert b'<data><a>keep</a></data>' == ET.tostring(root)
+
+    # It is still an ordinary mutator when called directly.
+    assert delete(root)
+
+
+def test_published_before():
+    root = ET.fromstring(
+        b'<channel>'
+        b'<item><pubDate>Fri, 21 Jul 2023 09:04 EDT</pubDate></item>'
+        b'<item><pubDate>Tue, 20 May 2003 08:56:02 GMT</pubDate></item>'
+        b'<item><pubDate>Mon, 19 May 2003 08:56:02 -0000</pubDate></item>'
+        b'<item><pubDate>last tuesday</pubDate></item>'
+        b'<item/>'
+        b'</channel>'
+    )
+
+    apply_one_mutation(root, './item', published_before(datetime(2020, 1, 1)))
+    assert [e.findtext('pubDate') for e in root] == [
+        'Fri, 21 Jul 2023 09:04 EDT', 'last tuesday', None
+    ]
+
+    cutoff = datetime(2023, 7, 21, 13, 5, tzinfo=timezone.utc)
+    apply_one_mutation(root, './item', published_before(cutoff))
+    assert [e.findtext('pubDate') for e in root] == ['last tuesday', None]
+
+
+def test_skip_absent_tag():
+    root = ET.fromstring(b'<data><a><b/></a></data>')
+
+    seen = []
+
+    def record(e: _Element) -> bool:
+        seen.append(e)
+        return False
+
+    apply_mutations(root, [('./a/c', record),
+                           ('.//c', record),
+                           ('c', record),
+                           ('./*/b', record)])
+    assert [e.tag for e in seen] == ['b']
+    apply_one_mutation(root, './a//b', TestMutators.delete())
+    assert b'<data><a/></data>' == ET.tostring(root)
+
+
+def test_xpath_text():
+    root = ET.fromstring(b'<data><a>one</a><b><a>two</a></b><c/></data>')
+
+    assert xpath_text('a')(root) == 'one'
+    assert xpath_text('./b/a')(root) == 'two'
+    assert xpath_text('c')(root) is None
+    assert xpath_text('d')(root) is None
+
+
+def test_namespaced_queries():
+    ns = 'urn:test'
+    root = ET.fromstring(f'<data xmlns:t="{ns}"><t:a><t:b>x</t:b><b/></t:a>'
+                         '<a><t:b/></a></data>'.encode())
+
+    assert xpath_text('t:a/t:b', {'t': ns})(root) == 'x'
+    apply_one_mutation(root, f'./{{{ns}}}a/{{{ns}}}b', delete)
+    apply_mutations(root, [('./a/t:b', delete)], {'t': ns})
+    assert (ET.tostring(root)
+            == f'<data xmlns:t="{ns}"><t:a><b/></t:a><a/></data>'.encode())
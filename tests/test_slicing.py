@@ -1,8 +1,17 @@
 """Tests for slicing functionality."""
 from copy import deepcopy
-import xml.etree.ElementTree as ET
+from io import BytesIO
+from pathlib import Path
+import lxml.etree as ET
+from lxml.etree import _Element, _ElementTree
 import pytest
-from rss_slicer import (SliceDefinition, slice_feeds, preserve_meta)
+from rss_slicer import (SliceDefinition,
+                        slice_feeds,
+                        slice_sources,
+                        slice_feeds_streaming,
+                        serialize,
+                        xpath_text,
+                        preserve_meta)
 from rss_slicer.rss import Channel
 
 
@@ -22,7 +31,7 @@ def fixture_trivial_channel():
                    description='I made this up')
 
 
-def test_empty_slicer(trivial_xml: ET.ElementTree, trivial_channel: Channel):
+def test_empty_slicer(trivial_xml: _ElementTree, trivial_channel: Channel):
     orig = deepcopy(trivial_xml)
 
     result = slice_feeds(
@@ -37,7 +46,7 @@ def test_empty_slicer(trivial_xml: ET.ElementTree, trivial_channel: Channel):
     assert old_items == new_items
 
 
-def test_strip_item_content(trivial_xml: ET.ElementTree,
+def test_strip_item_content(trivial_xml: _ElementTree,
                             trivial_channel: Channel):
     orig = deepcopy(trivial_xml)
     result = slice_feeds(
@@ -55,15 +64,17 @@ def test_strip_item_content(trivial_xml: ET.ElementTree,
             == [ET.tostring(n).strip() for n in new_items])
 
 
-def test_remove_item(trivial_xml: ET.ElementTree, trivial_channel: Channel):
+def test_remove_item(trivial_xml: _ElementTree, trivial_channel: Channel):
     orig = deepcopy(trivial_xml)
 
-    def starts_with_nasa(e: ET.Element) -> bool:
-        title = e.find('./title')
-        if title is None or title.text is None:
+    title_of = xpath_text('./title')
+
+    def starts_with_nasa(e: _Element) -> bool:
+        title = title_of(e)
+        if title is None:
             return False
 
-        return title.text.startswith('NASA')
+        return title.startswith('NASA')
 
     result = slice_feeds(
         [trivial_xml],
@@ -81,7 +92,32 @@ def test_remove_item(trivial_xml: ET.ElementTree, trivial_channel: Channel):
     assert all(starts_with_nasa(n) for n in new_items)
 
 
-def test_preserve_meta(trivial_xml: ET.ElementTree, trivial_channel: Channel):
+def test_remove_namespaced_child(trivial_channel: Channel):
+    dc = 'http://purl.org/dc/elements/1.1/'
+
+    def feed() -> _ElementTree:
+        return ET.ElementTree(ET.fromstring(
+            f'<rss xmlns:dc="{dc}"><channel><title>t</title>'
+            '<item><title>a</title><dc:creator>me</dc:creator></item>'
+            '<item><dc:creator>you</dc:creator></item>'
+            '</channel></rss>'.encode()
+        ))
+
+    for query, namespaces in ((f'./channel/item/{{{dc}}}creator', None),
+                              ('./channel/item/dc:creator', {'dc': dc})):
+        result = slice_feeds(
+            [feed()],
+            SliceDefinition(trivial_channel,
+                            slicers=[(query, lambda _: True)],
+                            namespaces=namespaces)
+        )
+
+        assert len(result.findall('./channel/item')) == 2
+        assert not result.findall(f'.//{{{dc}}}creator')
+        assert result.findtext('./channel/item/title') == 'a'
+
+
+def test_preserve_meta(trivial_xml: _ElementTree, trivial_channel: Channel):
     orig = deepcopy(trivial_xml)
 
     result = slice_feeds(
@@ -99,6 +135,17 @@ def test_preserve_meta(trivial_xml: ET.ElementTree, trivial_channel: Channel):
     assert Channel.parse(orig_channel) == Channel.parse(result_channel)
 
 
+def test_empty_tree(trivial_xml: _ElementTree, trivial_channel: Channel):
+    orig = deepcopy(trivial_xml)
+    result = slice_feeds(
+        [ET.ElementTree(), trivial_xml],
+        SliceDefinition(trivial_channel, [])
+    )
+
+    assert (len(orig.findall('./channel/item'))
+            == len(result.findall('./channel/item')))
+
+
 def test_bad_rss_no_channel(trivial_channel):
     doc = ET.ElementTree(
         ET.Element('rss', attrib={'version': '2.0'})
@@ -112,3 +159,164 @@ def test_bad_rss_no_channel(trivial_channel):
                 slicers=[]
             )
         )
+
+
+def test_slice_sources(trivial_xml: _ElementTree, trivial_channel: Channel):
+    def not_louisiana(e: _Element) -> bool:
+        return 'Louisiana' in e.findtext('./title', '')
+
+    definition = SliceDefinition(
+        trivial_channel,
+        slicers=[('./channel/item', not_louisiana),
+                 ('./channel/item/enclosure', lambda _: True),
+                 ('./channel/docs', lambda _: True)]
+    )
+
+    expected = slice_feeds([trivial_xml], definition)
+    result = slice_sources(['./tests/samples/trivial.xml',
+                            BytesIO(b'<rss><channel/></rss>')],
+                           definition)
+
+    assert ET.tostring(expected) == ET.tostring(result)
+    assert len(result.findall('./channel/item')) == 4
+    assert result.find('./channel/docs') is None
+
+
+def _retag(e: _Element) -> bool:
+    e.tag = 'entry'
+    return False
+
+
+def _add_generator(e: _Element) -> bool:
+    ET.SubElement(e, 'generator').text = 'slicer'
+    return False
+
+
+@pytest.mark.parametrize('slicers', [
+    [('./channel/item', _retag)],
+    [('./channel', _add_generator)],
+])
+def test_slice_sources_collects_items(trivial_xml: _ElementTree,
+                                      trivial_channel: Channel,
+                                      slicers: list):
+    definition = SliceDefinition(trivial_channel, slicers)
+
+    expected = slice_feeds([trivial_xml], definition)
+    result = slice_sources(['./tests/samples/trivial.xml'], definition)
+
+    assert ET.tostring(expected) == ET.tostring(result)
+
+
+@pytest.mark.parametrize('source, slicers', [
+    (b'<rss version="2.0"/>', []),
+    (b'<rss><item/></rss>', []),
+    (b'<item/>', []),
+    (b'<rss><channel><item/></channel></rss>',
+     [('./channel', lambda _: True)]),
+])
+def test_slice_sources_no_channel(trivial_channel: Channel,
+                                  source: bytes,
+                                  slicers: list):
+    with pytest.raises(ValueError):
+        _ = slice_sources([BytesIO(source)],
+                          SliceDefinition(trivial_channel, slicers))
+
+
+def test_slice_feeds_streaming(trivial_channel: Channel):
+    definition = SliceDefinition(
+        trivial_channel,
+        slicers=[('./channel/item', lambda e: e.find('./title') is None),
+                 ('./channel/docs', lambda _: True)]
+    )
+    paths = ['./tests/samples/trivial.xml', './tests/samples/trivial.xml']
+
+    expected = slice_sources(paths, definition)
+    out = BytesIO()
+    slice_feeds_streaming(paths, definition, out)
+    result = ET.fromstring(out.getvalue())
+    # The streamed items keep the whitespace they had in their input.
+    ET.indent(result)
+
+    assert out.getvalue().startswith(b"<?xml version='1.0' encoding='utf-8'?>")
+    assert Channel.parse(result[0]) == Channel.parse(expected.getroot()[0])
+    assert ([ET.tostring(e) for e in result.iter('item')]
+            == [ET.tostring(e) for e in expected.iter('item')])
+    assert len(result.findall('./channel/item')) == 8
+
+
+@pytest.mark.parametrize('slicers', [
+    [('./channel/item', _retag)],
+    [('./channel', _add_generator)],
+])
+def test_slice_feeds_streaming_collects_items(trivial_xml: _ElementTree,
+                                              trivial_channel: Channel,
+                                              slicers: list):
+    definition = SliceDefinition(trivial_channel, slicers)
+
+    expected = slice_feeds([trivial_xml], definition)
+    out = BytesIO()
+    slice_feeds_streaming(['./tests/samples/trivial.xml'], definition, out)
+    result = ET.fromstring(out.getvalue())
+    ET.indent(result)
+
+    assert ET.tostring(expected) == ET.tostring(result)
+
+
+@pytest.mark.parametrize('source, slicers', [
+    (b'<rss version="2.0"/>', []),
+    (b'<rss><item/></rss>', []),
+    (b'<rss><channel><item/></channel></rss>',
+     [('./channel', lambda _: True)]),
+])
+def test_slice_feeds_streaming_no_channel(tmp_path: Path,
+                                          trivial_channel: Channel,
+                                          source: bytes,
+                                          slicers: list):
+    path = tmp_path / 'feed.xml'
+    path.write_bytes(source)
+    out = BytesIO()
+
+    with pytest.raises(ValueError):
+        slice_feeds_streaming([str(path)],
+                              SliceDefinition(trivial_channel, slicers),
+                              out)
+    assert out.getvalue() == b''
+
+
+def test_parallel_slice(trivial_xml: _ElementTree, trivial_channel: Channel):
+    definition = SliceDefinition(
+        trivial_channel,
+        slicers=[('./channel/item/guid', lambda _: True)]
+    )
+
+    expected = slice_feeds([deepcopy(trivial_xml), deepcopy(trivial_xml)],
+                           definition)
+    result = slice_feeds([deepcopy(trivial_xml), deepcopy(trivial_xml)],
+                         definition,
+                         max_workers=4)
+
+    assert ET.tostring(expected) == ET.tostring(result)
+    assert len(result.findall('./channel/item')) == 10
+    assert result.find('./channel/item/guid') is None
+
+
+def test_serialize(trivial_xml: _ElementTree, trivial_channel: Channel):
+    declaration = b"<?xml version='1.0' encoding='utf-8'?>\n"
+    result = slice_feeds([trivial_xml], SliceDefinition(trivial_channel, []))
+    before = ET.tostring(result)
+    output = serialize(result)
+
+    assert output.startswith(declaration)
+    assert b'\n  <channel>\n    <title>' in output
+    assert ET.tostring(result) == before
+
+    bare = ET.ElementTree(
+        ET.fromstring(b'<rss><channel><title>t</title></channel></rss>')
+    )
+    assert (serialize(bare, False)
+            == declaration + b'<rss><channel><title>t</title></channel></rss>')
+    assert (serialize(bare)
+            == declaration + b'<rss>\n  <channel>\n    <title>t</title>\n'
+                             b'  </channel>\n</rss>\n')
+    assert (serialize(bare, False)
+            == declaration + b'<rss><channel><title>t</title></channel></rss>')